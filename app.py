@@ -1,10 +1,14 @@
 # app.py
-from flask import Flask, jsonify, render_template
-import requests
-import pandas as pd
-import json
+from flask import Flask, Response, render_template, request
+import urllib3
+import redis
+import orjson
+from concurrent.futures import ThreadPoolExecutor
 import math
 import time
+import hashlib
+import threading
+import secrets
 import os
 
 app = Flask(__name__)
@@ -18,9 +22,71 @@ MAGANGHUB_PARAMS = {
     'kode_provinsi': 31 # Filter DKI Jakarta
 }
 
-# Cache data lowongan
-LOWONGAN_CACHE = []
-LAST_SCRAPED = 0
+# Batas request halaman yang berjalan bersamaan
+MAX_CONCURRENT_PAGES = 8
+
+# Pool koneksi bersama agar socket HTTPS dipakai ulang antar request.
+# block=True: jika semua koneksi terpakai, thread menunggu koneksi kembali ke pool
+# alih-alih membuka koneksi baru yang lalu dibuang ("Connection pool is full").
+HTTP_POOL = urllib3.PoolManager(
+    num_pools=4,
+    maxsize=MAX_CONCURRENT_PAGES,
+    block=True,
+    headers={'User-Agent': 'Simple-Scraper/1.0', 'Accept-Encoding': 'gzip, deflate'},
+    retries=urllib3.Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+)
+
+# Cache data lowongan (Redis jika REDIS_URL tersedia, dibagi antar worker)
+CACHE_TTL = 3600
+# Data basi tetap disimpan lebih lama agar bisa disajikan selama refresh
+CACHE_STALE_TTL = 24 * 3600
+REFRESH_LEASE_TTL = 60
+# Request yang menunggu scrape cold-start worker lain (mode Redis); setelah batas ini
+# request jatuh ke scrape in-process, bukan mengembalikan data kosong
+COLD_WAIT_TIMEOUT = REFRESH_LEASE_TTL
+COLD_POLL_INTERVAL = 0.5
+CACHE_KEY_RESPONSE = 'maganghub:response:v1'
+CACHE_KEY_ETAG = 'maganghub:etag:v1'
+CACHE_KEY_FRESH = 'maganghub:fresh:v1'
+CACHE_KEY_REFRESH_LEASE = 'maganghub:refresh-lease:v1'
+# Lease hanya boleh dilepas/diperpanjang oleh pemegang token-nya
+LUA_LEPAS_LEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+LUA_PERPANJANG_LEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+REDIS_URL = os.environ.get('REDIS_URL')
+# Timeout pendek: Redis yang tidak merespons harus cepat jatuh ke cadangan in-process
+REDIS_SOCKET_TIMEOUT = 1
+R = redis.Redis.from_url(
+    REDIS_URL,
+    socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+    socket_timeout=REDIS_SOCKET_TIMEOUT
+) if REDIS_URL else None
+# Setelah error Redis, cache in-process dipakai dulu selama REDIS_RETRY_DELAY detik
+REDIS_RETRY_DELAY = 30
+REDIS_DOWN_UNTIL = 0
+
+# Cadangan cache in-process jika Redis tidak dikonfigurasi atau sedang bermasalah.
+# Selalu diganti sebagai satu dict utuh agar pembaca tidak melihat data setengah jadi.
+LOWONGAN_CACHE = {'data': [], 'body': b'', 'etag': '', 'scraped': 0}
+
+# Penanda refresh background yang sedang berjalan (untuk cache in-process)
+REFRESH_LOCK = threading.Lock()
+IS_REFRESHING = False
+# Padanan lease Redis: refresh berikutnya tidak dicoba sebelum waktu ini
+NEXT_REFRESH_AT = 0
+# Memastikan hanya satu scrape cold-start per proses. SCRAPE_GENERATION naik setiap
+# scrape cold-start selesai, agar thread yang mengantre tahu scrape itu gagal.
+SCRAPE_LOCK = threading.Lock()
+SCRAPE_GENERATION = 0
 
 # --- FUNGSI UTILITY ---
 
@@ -31,89 +97,351 @@ def hitung_peluang(kuota, pelamar):
     peluang = (kuota / pelamar) * 100
     return min(peluang, 100.0)
 
-# --- FUNGSI SCRAPING ---
+def pakai_redis():
+    """Mengecek apakah Redis dikonfigurasi dan tidak sedang dinonaktifkan karena error."""
+    return R is not None and time.time() >= REDIS_DOWN_UNTIL
 
-def proses_data_api():
-    """Mengambil semua halaman API MagangHub (dengan cache 1 jam)."""
-    global LOWONGAN_CACHE, LAST_SCRAPED
-    
-    # Gunakan cache jika data belum kedaluwarsa (1 jam)
-    if time.time() - LAST_SCRAPED < 3600 and LOWONGAN_CACHE:
-        print("Menggunakan data dari cache.")
-        return LOWONGAN_CACHE
+def redis_gagal(aksi, e):
+    """Mencatat error Redis dan beralih ke cache in-process untuk sementara."""
+    global REDIS_DOWN_UNTIL
+    REDIS_DOWN_UNTIL = time.time() + REDIS_RETRY_DELAY
+    print(f"ERROR Redis: Gagal {aksi}. Memakai cache in-process selama {REDIS_RETRY_DELAY} detik. ({e})")
+
+def redis_mget(keys):
+    """Membaca beberapa key dari Redis dalam satu round-trip; None jika Redis bermasalah."""
+    try:
+        return R.mget(keys)
+    except redis.exceptions.RedisError as e:
+        redis_gagal(f"membaca {', '.join(keys)}", e)
+        return None
+
+def redis_setex(mapping):
+    """Menyimpan beberapa key ke Redis sekaligus; mapping berisi key -> (value, ttl)."""
+    try:
+        pipe = R.pipeline()
+        for key, (value, ttl) in mapping.items():
+            pipe.setex(key, ttl, value)
+        pipe.execute()
+    except redis.exceptions.RedisError as e:
+        redis_gagal("menyimpan cache", e)
+
+def ambil_lease():
+    """Mengambil lease refresh Redis; mengembalikan token, atau None jika dipegang worker lain.
+
+    RedisError diteruskan ke pemanggil.
+    """
+    token = secrets.token_hex(16)
+    if R.set(CACHE_KEY_REFRESH_LEASE, token, nx=True, ex=REFRESH_LEASE_TTL):
+        return token
+    return None
+
+def lepas_lease(token):
+    """Melepas lease refresh, hanya jika masih dipegang oleh token ini."""
+    try:
+        R.eval(LUA_LEPAS_LEASE, 1, CACHE_KEY_REFRESH_LEASE, token)
+    except redis.exceptions.RedisError as e:
+        redis_gagal("melepas lease refresh", e)
+
+def _perpanjang_lease(token, selesai):
+    """Memperpanjang lease selama scrape berjalan; berhenti jika lease bukan milik token lagi."""
+    while not selesai.wait(REFRESH_LEASE_TTL / 3):
+        try:
+            if not R.eval(LUA_PERPANJANG_LEASE, 1, CACHE_KEY_REFRESH_LEASE, token, REFRESH_LEASE_TTL):
+                print("Lease refresh sudah tidak dipegang, berhenti memperpanjang.")
+                return
+        except redis.exceptions.RedisError as e:
+            redis_gagal("memperpanjang lease refresh", e)
+            return
+
+def buat_etag(body):
+    """Membuat ETag dari isi body response."""
+    return hashlib.md5(body).hexdigest()
 
+def cache_basi(cache):
+    """Mengecek apakah cache in-process sudah melewati CACHE_TTL."""
+    return time.time() - cache['scraped'] >= CACHE_TTL
+
+def baca_cache():
+    """Mengembalikan (cache, segar); cache berisi 'body' dan 'etag' (serta 'data' untuk in-process)."""
+    if pakai_redis():
+        values = redis_mget([CACHE_KEY_RESPONSE, CACHE_KEY_ETAG, CACHE_KEY_FRESH])
+        if values is not None:
+            body, etag, fresh = values
+            if not body:
+                return None, False
+            return {'body': body, 'etag': etag.decode() if etag else buat_etag(body)}, fresh is not None
+
+    cache = LOWONGAN_CACHE
+    if not cache['body']:
+        return None, False
+    return cache, not cache_basi(cache)
+
+def cache_ada():
+    """Mengecek apakah sudah ada data (segar maupun basi) di cache."""
+    if pakai_redis():
+        try:
+            return bool(R.exists(CACHE_KEY_RESPONSE))
+        except redis.exceptions.RedisError as e:
+            redis_gagal(f"membaca {CACHE_KEY_RESPONSE}", e)
+    return bool(LOWONGAN_CACHE['body'])
+
+def ambil_cache():
+    """Mengembalikan cache lowongan (None jika scrape gagal); memicu refresh jika sudah basi."""
+    cache, segar = baca_cache()
+    if cache is None:
+        # Cache kosong: tidak ada yang bisa disajikan, scrape secara langsung
+        return _scrape_cold()
+    if not segar:
+        mulai_refresh()
+    return cache
+
+# --- FUNGSI SCRAPING ---
+
+def ekstrak_lowongan(items):
+    """Mengekstrak data lowongan dari item mentah API (semua halaman)."""
     all_data = []
-    current_page = 1
-    total_pages = 1
+    for item in items:
+        kuota = item.get('jumlah_kuota', 0)
+        pelamar = item.get('jumlah_terdaftar', 0)
+
+        all_data.append({
+            'id': item.get('id_posisi', ''),
+            'posisi': item.get('posisi', 'N/A'),
+            'perusahaan': item.get('perusahaan', {}).get('nama_perusahaan', 'N/A'),
+            'kuota': kuota,
+            'pendaftar': pelamar,
+            'peluang': round(hitung_peluang(kuota, pelamar), 2),
+        })
+    return all_data
+
+def fetch_page(page):
+    """Mengambil satu halaman API lewat pool koneksi bersama."""
+    response = HTTP_POOL.request(
+        'GET',
+        MAGANGHUB_BASE_URL,
+        fields={**MAGANGHUB_PARAMS, 'page': page},
+        timeout=urllib3.Timeout(total=30)
+    )
+    if response.status >= 400:
+        raise urllib3.exceptions.HTTPError(f"HTTP {response.status}")
+    if page == 1:
+        print(f"Content-Encoding MagangHub: {response.headers.get('Content-Encoding', 'identity')}")
+    # response.data sudah didekompresi otomatis oleh urllib3
+    return orjson.loads(response.data)
+
+def _scrape_cold():
+    """Scrape saat cache kosong; hanya satu yang berjalan, request lain menunggu hasilnya."""
+    if pakai_redis():
+        try:
+            token = ambil_lease()
+        except redis.exceptions.RedisError as e:
+            # Lanjut ke jalur in-process di bawah
+            redis_gagal("mengambil lease refresh", e)
+        else:
+            if token is None:
+                return _tunggu_cache_redis()
+            # Dilepas segera setelah selesai agar request yang menunggu tidak perlu menunggu TTL lease
+            return _refresh_dengan_lease(token, lepas=True)
+
+    return _scrape_cold_lokal()
+
+def _scrape_cold_lokal():
+    """Scrape cold-start dengan SCRAPE_LOCK; thread yang mengantre memakai hasil scrape terakhir."""
+    global SCRAPE_GENERATION
+    generasi = SCRAPE_GENERATION
+    with SCRAPE_LOCK:
+        # Cek ulang: thread lain mungkin sudah selesai scrape selama kita menunggu lock
+        cache, _ = baca_cache()
+        if cache is not None:
+            return cache
+        if SCRAPE_GENERATION != generasi:
+            # Scrape yang kita tunggu baru saja gagal; jangan diulang oleh setiap antrean
+            return None
+        try:
+            return _refresh()
+        finally:
+            SCRAPE_GENERATION += 1
+
+def _tunggu_cache_redis():
+    """Menunggu worker pemegang lease selesai mengisi cache Redis.
+
+    Jika lease hilang tanpa cache, scrape pemegang lease gagal dan None dikembalikan.
+    Jika menunggu terlalu lama, scrape dilakukan sendiri lewat jalur in-process.
+    """
+    deadline = time.time() + COLD_WAIT_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(COLD_POLL_INTERVAL)
+        cache, _ = baca_cache()
+        if cache is not None:
+            return cache
+        if not pakai_redis():
+            # Redis bermasalah selama menunggu: scrape lewat jalur in-process
+            return _scrape_cold_lokal()
+        try:
+            if not R.exists(CACHE_KEY_REFRESH_LEASE):
+                # Pemegang lease selesai tanpa mengisi cache (scrape gagal)
+                return None
+        except redis.exceptions.RedisError as e:
+            redis_gagal("membaca lease refresh", e)
+            return _scrape_cold_lokal()
+    print("Terlalu lama menunggu scrape worker lain, scrape sendiri.")
+    return _scrape_cold_lokal()
+
+def mulai_refresh():
+    """Menjalankan _refresh di thread background, maksimal satu refresh sekaligus."""
+    global IS_REFRESHING, NEXT_REFRESH_AT
+
+    token = None
+    if pakai_redis():
+        # Lease Redis memastikan hanya satu worker yang melakukan scrape
+        try:
+            token = ambil_lease()
+        except redis.exceptions.RedisError as e:
+            redis_gagal("mengambil lease refresh", e)
+        else:
+            if token is None:
+                return
+
+    if token is None:
+        with REFRESH_LOCK:
+            if IS_REFRESHING or time.time() < NEXT_REFRESH_AT:
+                return
+            IS_REFRESHING = True
+            NEXT_REFRESH_AT = time.time() + REFRESH_LEASE_TTL
+
+    print("Cache kedaluwarsa, memperbarui data di background...")
+    threading.Thread(target=_refresh_background, args=(token,), daemon=True).start()
+
+def _refresh_dengan_lease(token, lepas):
+    """Menjalankan _refresh sambil memperpanjang lease Redis milik token."""
+    selesai = threading.Event()
+    threading.Thread(target=_perpanjang_lease, args=(token, selesai), daemon=True).start()
+    try:
+        return _refresh()
+    finally:
+        selesai.set()
+        if lepas:
+            lepas_lease(token)
+
+def _refresh_background(token=None):
+    """Target thread refresh; melepas penanda in-process setelah selesai."""
+    global IS_REFRESHING
+    try:
+        if token is not None:
+            _refresh_dengan_lease(token, lepas=False)
+        else:
+            _refresh()
+    finally:
+        # Lease Redis (dan NEXT_REFRESH_AT) dibiarkan kedaluwarsa sendiri,
+        # sekaligus menjadi jeda sebelum percobaan ulang jika refresh gagal
+        with REFRESH_LOCK:
+            IS_REFRESHING = False
+
+def _refresh():
+    """Mengambil semua halaman API MagangHub lalu mengganti isi cache; mengembalikan cache baru.
+
+    Jika ada halaman yang gagal, cache lama dipertahankan (None dikembalikan). Hasil
+    tidak lengkap hanya disimpan bila cache masih kosong, dan langsung ditandai basi
+    agar segera di-refresh.
+    """
+    global LOWONGAN_CACHE
+
+    items = []
     
     print("Memulai pengambilan data MagangHub (seluruh halaman)...")
 
-    while current_page <= total_pages:
-        params = MAGANGHUB_PARAMS.copy()
-        params['page'] = current_page
-        
+    # Halaman pertama diambil sendiri untuk mengetahui jumlah halaman
+    try:
+        data = fetch_page(1)
+    except (urllib3.exceptions.HTTPError, ValueError) as e:
+        print(f"ERROR MagangHub API: Gagal mengambil halaman 1. Berhenti. ({e})")
+        return None
+
+    total_pages = data.get('meta', {}).get('pagination', {}).get('last_page', 1)
+    total_items = data.get('meta', {}).get('pagination', {}).get('total', 0)
+    print(f"Total Lowongan: {total_items}. Mengambil semua {total_pages} halaman.")
+
+    items.extend(data.get('data', []))
+
+    # Halaman sisanya diambil paralel (socket dilepas GIL saat menunggu I/O)
+    pages = list(range(2, total_pages + 1))
+    gagal = []
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_PAGES) as ex:
+        futures = [ex.submit(fetch_page, p) for p in pages]
+
+    for page, future in zip(pages, futures):
         try:
-            response = requests.get(
-                MAGANGHUB_BASE_URL, 
-                params=params, 
-                timeout=30,
-                headers={'User-Agent': 'Simple-Scraper/1.0'}
-            )
-            response.raise_for_status()
-            data = response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"ERROR MagangHub API: Gagal mengambil halaman {current_page}. Berhenti. ({e})")
-            break
-
-        if current_page == 1:
-            total_pages = data.get('meta', {}).get('pagination', {}).get('last_page', 1)
-            total_items = data.get('meta', {}).get('pagination', {}).get('total', 0)
-            print(f"Total Lowongan: {total_items}. Mengambil semua {total_pages} halaman.")
-        
-        # Ekstraksi data
-        for item in data.get('data', []):
-            kuota = item.get('jumlah_kuota', 0)
-            pelamar = item.get('jumlah_terdaftar', 0)
-            
-            all_data.append({
-                'id': item.get('id_posisi', ''),
-                'posisi': item.get('posisi', 'N/A'),
-                'perusahaan': item.get('perusahaan', {}).get('nama_perusahaan', 'N/A'),
-                'kuota': kuota,
-                'pendaftar': pelamar,
-                'peluang': round(hitung_peluang(kuota, pelamar), 2),
-            })
-        
-        print(f"-> Mengambil halaman {current_page}/{total_pages}...")
-        current_page += 1
-        time.sleep(0.5)
-
-    LOWONGAN_CACHE = all_data
-    LAST_SCRAPED = time.time()
-    return all_data
+            result = future.result()
+        except (urllib3.exceptions.HTTPError, ValueError) as e:
+            print(f"ERROR MagangHub API: Gagal mengambil halaman {page}. Dilewati. ({e})")
+            gagal.append(page)
+            continue
+        items.extend(result.get('data', []))
+
+    print(f"-> Selesai mengambil {total_pages} halaman.")
+
+    lengkap = not gagal
+    if not lengkap and cache_ada():
+        print(f"Scrape tidak lengkap ({len(gagal)} halaman gagal). Cache lama dipertahankan.")
+        return None
+
+    all_data = ekstrak_lowongan(items)
+
+    # Sortir default: Peluang tertinggi, lalu serialisasi sekali untuk /api/data
+    all_data.sort(key=lambda r: (-r['peluang'], -r['kuota']))
+    response_bytes = orjson.dumps(all_data)
+    etag = buat_etag(response_bytes)
+
+    cache = {
+        'data': all_data,
+        'body': response_bytes,
+        'etag': etag,
+        'scraped': time.time() if lengkap else 0,
+    }
+    # Cache in-process selalu diisi agar tetap ada cadangan saat Redis bermasalah
+    LOWONGAN_CACHE = cache
+    if pakai_redis():
+        mapping = {
+            CACHE_KEY_RESPONSE: (response_bytes, CACHE_STALE_TTL),
+            CACHE_KEY_ETAG: (etag, CACHE_STALE_TTL),
+        }
+        if lengkap:
+            mapping[CACHE_KEY_FRESH] = (1, CACHE_TTL)
+        redis_setex(mapping)
+    return cache
 
 # --- ENDPOINTS FLASK ---
 
+# index.html tidak memakai variabel per-request, jadi cukup dirender sekali
+with app.app_context():
+    INDEX_HTML = render_template('index.html')
+
 @app.route('/')
 def index():
     """Menampilkan halaman utama (frontend)."""
-    return render_template('index.html')
+    return INDEX_HTML, 200, {'Cache-Control': 'public, max-age=300'}
 
 @app.route('/api/data', methods=['GET'])
 def get_lowongan_data():
     """Endpoint untuk mengambil semua data dan mengirimkannya."""
     
-    lowongan_data = proses_data_api()
-    
-    if not lowongan_data:
-        return jsonify([])
-        
-    df = pd.DataFrame(lowongan_data)
-    
-    # Sortir default: Peluang tertinggi
-    df = df.sort_values(by=['peluang', 'kuota'], ascending=[False, False])
+    cache = ambil_cache()
+    if cache is None:
+        # Scrape gagal dan belum ada data: jangan sampai "tidak ada lowongan" ikut di-cache
+        resp = Response(orjson.dumps([]), status=503, mimetype='application/json')
+        resp.headers['Cache-Control'] = 'no-store'
+        return resp
+    body, etag = cache['body'], cache['etag']
     
-    return jsonify(df.to_dict('records'))
+    # Klien yang masih memegang versi yang sama cukup mendapat 304
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        resp = Response(body, mimetype='application/json')
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = 'public, max-age=60'
+    return resp
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # Server development saja; produksi memakai gunicorn (lihat Procfile)
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1', host='0.0.0.0', port=5000)
\ No newline at end of file